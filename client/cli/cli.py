@@ -1,19 +1,22 @@
 import sys
 import threading
-from typing import Callable
+from typing import Any, Callable, Dict, Optional
 from prompt_toolkit import print_formatted_text, HTML, PromptSession
 from prompt_toolkit.shortcuts import prompt
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from cli.command import handle
 from config import OperatorConfig
 from .completer import FullCompleter, get_home_dynamic_completer
-from comms import get_server_stats
+from comms import gather_dashboard, get_server_stats
 from .style import PROMPT_STYLE
 from .banner import get_full_banner
 
 
-def bottom_bar(config: OperatorConfig) -> Callable:
-    server_stats = get_server_stats(config)
+def bottom_bar(
+    config: OperatorConfig, server_stats: Optional[Dict[str, Any]] = None
+) -> Callable:
+    if server_stats is None:
+        server_stats = get_server_stats(config)
     return lambda: HTML(
         f"User: <b bg='ansired'>{config.name}</b> | Implants: <b bg='ansired'>{server_stats['implants']}</b> | Operators: <b bg='ansired'>{server_stats['operators']}</b> | Uptime: <b bg='ansired'>{server_stats['uptime']}</b>"
     )
@@ -24,14 +27,15 @@ def main_loop(config: OperatorConfig):
 
     while True:
         try:
+            implants, server_stats, tasks = gather_dashboard(config)
             session = PromptSession(
                 message=HTML(
                     f"<warning>maliketh</warning> (<home>{config.name}</home>) > "
                 ),
                 style=PROMPT_STYLE,
                 enable_history_search=True,
-                completer=get_home_dynamic_completer(config),
-                bottom_toolbar=bottom_bar(config),
+                completer=get_home_dynamic_completer(config, implants, tasks),
+                bottom_toolbar=bottom_bar(config, server_stats),
                 auto_suggest=AutoSuggestFromHistory(),
             )
             text = session.prompt()
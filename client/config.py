@@ -1,4 +1,6 @@
 from dataclasses import dataclass, asdict
+from datetime import datetime
+from functools import cached_property
 import json
 from typing import Optional
 import logging
@@ -34,12 +36,20 @@ class OperatorConfig:
     server_pub: str
     rmq_queue: str
     auth_token: Optional[str] = None
+    auth_token_expiry: Optional[datetime] = None  # Local time the auth token expires
+
+    @cached_property
+    def base_url(self) -> str:
+        """
+        The base URL of the operator listener, built once per config.
+        """
+        return f"http://{self.c2}:{self.c2_port}"
 
     def to_dict(self) -> dict:
         return asdict(self)
 
     def to_json(self) -> str:
-        return json.dumps(self.to_dict())
+        return json.dumps(self.to_dict(), default=str)
 
     @staticmethod
     def from_json(json_str: str) -> "OperatorConfig":
